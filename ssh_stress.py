@@ -1,10 +1,170 @@
 #!/usr/bin/env python3
-import asyncio, asyncssh, time, os, threading, sys, argparse, json
+import asyncio, asyncssh, time, os, sys, argparse, json
 from typing import Optional
-from itertools import cycle
-import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait
+from functools import partial
+
+# uvloop is a faster drop-in event loop, it's not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from tsdownsample import MinMaxLTTBDownsampler
+except ImportError:
+    MinMaxLTTBDownsampler = None
+
+def run(coro):
+    """asyncio.run() on uvloop when it's installed"""
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+        return runner.run(coro)
+
+# Max points plotted per line, matplotlib gets very slow with more
+GRAPH_POINTS = 2000
+
+def downsample(x, y):
+    """Reduce the points to plot with MinMaxLTTB, y must not contain NaN"""
+    if MinMaxLTTBDownsampler is None or len(x) <= GRAPH_POINTS:
+        return x, y
+    idx = MinMaxLTTBDownsampler().downsample(x, y, n_out=GRAPH_POINTS)
+    return x[idx], y[idx]
+
+# Array type of each connection field, the "results" field is kept as a list
+CONN_FIELDS = {
+        "id"        : np.int32,
+        "success"   : np.bool_,
+        "auth_time" : np.float32,
+        "conn_time" : np.float32,
+        }
+
+def new_conn_data(conns:int) -> dict:
+    """Empty connection results for a round, every connection starts out as failed"""
+    return {
+            "id"        : np.arange(1, conns + 1, dtype=CONN_FIELDS["id"]),
+            "success"   : np.zeros(conns, dtype=CONN_FIELDS["success"]),
+            "auth_time" : np.full(conns, np.nan, dtype=CONN_FIELDS["auth_time"]),
+            "conn_time" : np.full(conns, np.nan, dtype=CONN_FIELDS["conn_time"]),
+            "results"   : [None] * conns,
+            }
+
+def new_conn_totals(round_name:str) -> dict:
+    """Running stats of a round whose connection results are streamed to a file instead of kept in memory"""
+    return {
+            "round"         : round_name,
+            "conns"         : 0,
+            "failed"        : 0,
+            "sum_auth_time" : 0.0,
+            "sum_conn_time" : 0.0,
+            "max_auth_time" : 0,
+            "max_conn_time" : 0,
+            "min_auth_time" : float('inf'),
+            "min_conn_time" : float('inf'),
+            }
+
+def totals_to_stats(totals:dict) -> dict:
+    succeeded = totals["conns"] - totals["failed"]
+    return {
+            "avg_auth_time"         : totals["sum_auth_time"] / succeeded if succeeded else 0,
+            "avg_conn_time"         : totals["sum_conn_time"] / succeeded if succeeded else 0,
+            "max_auth_time"         : totals["max_auth_time"],
+            "max_conn_time"         : totals["max_conn_time"],
+            "min_auth_time"         : totals["min_auth_time"],
+            "min_conn_time"         : totals["min_conn_time"],
+            "failed_conns"          : totals["failed"],
+            }
+
+def conn_arrays(conn_data) -> dict:
+    """The connection results as arrays, also reads the per connection records older output files stored"""
+    if isinstance(conn_data, dict) and "success" in conn_data:
+        arrays = {field: np.asarray(conn_data[field], dtype=dtype) for field, dtype in CONN_FIELDS.items()}
+        arrays["results"] = conn_data["results"]
+        return arrays
+
+    records = list(conn_data.values()) if isinstance(conn_data, dict) else conn_data
+    n = len(records)
+    return {
+            "id"        : np.fromiter((d["id"] for d in records), dtype=CONN_FIELDS["id"], count=n),
+            "success"   : np.fromiter((d["success"] for d in records), dtype=CONN_FIELDS["success"], count=n),
+            "auth_time" : np.fromiter((d["auth_time"] if d["success"] else np.nan for d in records), dtype=CONN_FIELDS["auth_time"], count=n),
+            "conn_time" : np.fromiter((d["conn_time"] if d["success"] else np.nan for d in records), dtype=CONN_FIELDS["conn_time"], count=n),
+            "results"   : [d["results"] for d in records],
+            }
+
+def conn_data_to_dict(conn_data:dict) -> dict:
+    """JSON serializable copy of the connection results"""
+    data = {field: np.asarray(conn_data[field]).tolist() for field in CONN_FIELDS}
+    # NaN isn't valid JSON, failed connections' times are written as null
+    success = np.asarray(conn_data["success"], dtype=CONN_FIELDS["success"])
+    for field in ("auth_time", "conn_time"):
+        data[field] = np.where(success, np.asarray(conn_data[field]), None).tolist()
+    data["results"] = conn_data["results"]
+    return data
+
+def stats_to_dict(stats:dict) -> dict:
+    """JSON serializable copy of the stats"""
+    stats = dict(stats)
+    stats["round_data"] = {
+            round_name: {**round_stat, "conn_data": conn_data_to_dict(round_stat["conn_data"])} if "conn_data" in round_stat else round_stat
+            for round_name, round_stat in stats["round_data"].items()
+            }
+    return stats
+
+def dump_json(data:dict) -> bytes:
+    """Serialize the stats to indented JSON, orjson handles the NumPy arrays natively"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(stats_to_dict(data) if "round_data" in data else data, indent=2).encode()
+
+def dump_json_line(data:dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(data).encode() + b"\n"
+
+def load_json(data:bytes) -> dict:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Files written by the json module can contain Infinity/NaN,
+            # which orjson refuses to parse
+            pass
+    return json.loads(data)
+
+def merge_conn_data(shards:list) -> dict:
+    """Concatenate the connection results of the workers, renumbering the ids to follow each other"""
+    offset = 0
+    ids = []
+    for shard in shards:
+        ids.append(shard["id"] + offset)
+        offset += len(shard["id"])
+
+    conn_data = {field: np.concatenate([shard[field] for shard in shards]) for field in CONN_FIELDS}
+    conn_data["id"] = np.concatenate(ids)
+    conn_data["results"] = [result for shard in shards for result in shard["results"]]
+    return conn_data
+
+def gen_graph(data:dict, path:Optional[str] = None):
+    # Rounds streamed with --output-jsonl don't keep the connection data
+    if any("conn_data" not in stress_round for stress_round in data["round_data"].values()):
+        print("ERROR: Could not generate the graph, the connection data was streamed to a JSON lines file")
+        return
+
+    # matplotlib is slow to import, only pay for it when graphing. Saving
+    # to a file doesn't need a GUI, the Agg backend skips creating any
+    # windows and works without a display.
+    import matplotlib
+    if path:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
 
-def gen_graph(data:dict):
     global_wait     = data["global_wait"]
     conn_wait       = data["conn_wait"]
     conns_per_sec   = data["conns_per_sec"]
@@ -20,39 +180,41 @@ def gen_graph(data:dict):
     else:
         target_wait_time = conn_wait
 
-    round_index = 0
-    for round_name, stress_round in perf_times.items():
-        if len(stress_round["conn_data"]) < 2:
+    # Legend handles shared by every round, the last two only carry text
+    legend_handles = [
+            Line2D([], [], color='C0'),
+            Line2D([], [], color='C1'),
+            Line2D([], [], color='r', linestyle='--'),
+            Line2D([], [], color='none'),
+            Line2D([], [], color='none'),
+            ]
+
+    for ax, (round_name, stress_round) in zip(axs, perf_times.items()):
+        conn_data = conn_arrays(stress_round["conn_data"])
+        if len(conn_data["id"]) < 2:
             print("ERROR: Could not generate the graph, not enough data")
             return
 
-        x_axis   = []
-        y1_axis  = []
-        y2_axis  = []
-        failed   = []
-        max_time = 0
-
-        for data in stress_round["conn_data"].values():
-            x_axis.append(data["id"])
-            if data["success"]:
-                y1_axis.append(data["conn_time"])
-                y2_axis.append(data["auth_time"])
-                max_time = max(max_time, data["conn_time"])
-            else:
-                y1_axis.append(None)
-                y2_axis.append(None)
-                failed.append(data["id"])
+        success  = conn_data["success"]
+        # Only the successful connections are plotted as lines, failed ones
+        # get their own markers below
+        x_axis   = conn_data["id"][success]
+        y1_axis  = conn_data["conn_time"][success]
+        y2_axis  = conn_data["auth_time"][success]
+        failed   = conn_data["id"][~success]
+        max_time = y1_axis.max() if len(y1_axis) else 0
+
+        # Rasterize the lines when there are too many points to draw as vectors
+        rasterized = len(x_axis) > GRAPH_POINTS
 
-        axs[round_index].plot(x_axis, y1_axis, label='conn time')
-        axs[round_index].plot(x_axis, y2_axis, label='auth time')
+        ax.plot(*downsample(x_axis, y1_axis), color='C0', rasterized=rasterized)
+        ax.plot(*downsample(x_axis, y2_axis), color='C1', rasterized=rasterized)
 
-        for f in failed:
-            axs[round_index].plot(f, 2, marker='x', color='r')
+        if len(failed):
+            ax.scatter(failed, np.full(len(failed), 2), marker='x', c='r')
 
-        axs[round_index].axhline(y=target_wait_time, color="r", linestyle="--", label="Target conn time")
-        axs[round_index].plot([], [], label=f'speed: {conns_per_sec}/cps')
-        axs[round_index].plot([], [], label=f'failed: {len(failed)}')
-        axs[round_index].legend([
+        ax.axhline(y=target_wait_time, color="r", linestyle="--")
+        ax.legend(legend_handles, [
                     f"connection duration ({round(stress_round['avg_conn_time'], 2)}s)",
                     f"authentication duration ({round(stress_round['avg_auth_time'], 2)}s)",
                     f"Target time: {target_wait_time}s",
@@ -60,26 +222,20 @@ def gen_graph(data:dict):
                     f"failed: {len(failed)}"
                     ])
 
-        axs[round_index].set_ylim(0, max_time * 1.25)
-        axs[round_index].set_xlabel("Connection")
-        axs[round_index].set_ylabel("Time (seconds)")
-        axs[round_index].set_title(f"Graph for {round_name}")
-        round_index += 1
+        ax.set(
+                ylim=(0, max_time * 1.25),
+                xlabel="Connection",
+                ylabel="Time (seconds)",
+                title=f"Graph for {round_name}",
+                )
 
     plt.tight_layout()
-    plt.show()
-
+    if path:
+        plt.savefig(path, dpi=100, bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
 
-def drop_all_timer(n):
-    global wait
-    if n == 0:
-        wait=False
-        return
-    print(f'Dropping all connections in {n} seconds')
-    wait=True
-    time.sleep(n)
-    print(f'Dropping all connections now')
-    wait=False
 
 class SSHstress:
     def __init__(
@@ -90,7 +246,22 @@ class SSHstress:
         ssh_key:str                 = '~/.ssh/id_rsa',
         ssh_pw:Optional[str]        = None,
         timeout:float               = 36000,
-        max_concurrent_tasks:int    = 10000) -> None:
+        max_concurrent_tasks:int    = 10000,
+        quiet:bool                  = False,
+        output_jsonl:Optional[str]  = None) -> None:
+
+        # Kept to rebuild the instance in the worker processes
+        self._kwargs = {
+                "target_address"        : target_address,
+                "target_users"          : target_users,
+                "target_port"           : target_port,
+                "ssh_key"               : ssh_key,
+                "ssh_pw"                : ssh_pw,
+                "timeout"               : timeout,
+                "max_concurrent_tasks"  : max_concurrent_tasks,
+                "quiet"                 : quiet,
+                "output_jsonl"          : output_jsonl,
+                }
 
         full_key_path = os.path.expanduser(ssh_key)
         ssh_key = ssh_key if os.path.exists(full_key_path) else ''
@@ -100,15 +271,41 @@ class SSHstress:
             print("Either an SSH key or a passphrase must be provided to perform load testing.")
             sys.exit(2)
 
-        self.user                   = cycle(target_users)
+        self.users                  = tuple(target_users)
         self.host                   = target_address
         self.port                   = target_port
         self.ssh_key                = os.path.expanduser(ssh_key) if ssh_key is not None else '/'
         self.ssh_pw                 = ssh_pw
         self.timeout                = timeout
         self.max_concurrent_tasks   = max_concurrent_tasks
-
-    def _calculate_stats(self, perf_times:dict, conns, rounds, conns_per_sec:int, conn_wait:int, global_wait:int, graph:bool, stress_type:str):
+        self.quiet                  = quiet
+        self.output_jsonl           = output_jsonl
+        self._out_fp                = None
+
+        # Only try the auth methods we have credentials for, instead of
+        # letting asyncssh probe keyboard-interactive/GSSAPI first
+        preferred_auth = []
+        if self.ssh_key:
+            preferred_auth.append('publickey')
+        if self.ssh_pw:
+            preferred_auth.append('password')
+
+        # Built once and the key loaded up front, asyncssh re-reads keys
+        # given as paths on every connect. known_hosts=None skips reading
+        # and checking the known_hosts file on each connect as well.
+        self._opts = asyncssh.SSHClientConnectionOptions(
+            client_keys=asyncssh.load_keypairs([self.ssh_key]) if self.ssh_key else None,
+            password=self.ssh_pw,
+            port=self.port,
+            known_hosts=None,
+            preferred_auth=tuple(preferred_auth),
+            # Authentication timeout
+            login_timeout=0,
+            # Authentication timeout + TCP
+            connect_timeout=0
+        )
+
+    def _calculate_stats(self, perf_times:dict, conns, rounds, conns_per_sec:float, conn_wait:int, global_wait:int, graph:bool, stress_type:str, graph_out:Optional[str] = None, round_totals:Optional[dict] = None):
         stats = {
                 "stress_type"       : stress_type,
                 "rounds"            : rounds,
@@ -120,37 +317,31 @@ class SSHstress:
                 }
         
         rounds_dict = {}
-        for round_name, round_data in perf_times.items():
-            total_auth_time     = 0
-            total_conn_time     = 0
-            max_auth_time       = 0
-            max_conn_time       = 0
-            min_auth_time       = float('inf')
-            min_conn_time       = float('inf')
-            total_conns         = len(round_data)
-            total_failed        = 0
-
-            for data in round_data.values():
-                if data["success"]:
-                    auth_time           = data["auth_time"]
-                    total_auth_time    += auth_time
-                    max_auth_time       = max(max_auth_time, auth_time)
-                    min_auth_time       = min(min_auth_time, auth_time)
-
-                    conn_time          = data["conn_time"]
-                    total_conn_time    += conn_time
-                    max_conn_time       = max(max_conn_time, conn_time)
-                    min_conn_time       = min(min_conn_time, conn_time)
+        # Rounds streamed to the JSON lines file only kept their running totals
+        for round_name, totals in (round_totals or {}).items():
+            rounds_dict[round_name] = totals_to_stats(totals)
 
-                else:
-                    total_failed += 1
-            try:
-                avg_auth_time = total_auth_time / ( total_conns - total_failed )
-                avg_conn_time = total_conn_time / ( total_conns - total_failed )
+        for round_name, round_data in perf_times.items():
+            success      = round_data["success"]
+            total_failed = int(success.size - np.count_nonzero(success))
+
+            if total_failed < success.size:
+                auth_times    = round_data["auth_time"][success]
+                conn_times    = round_data["conn_time"][success]
+                avg_auth_time = float(auth_times.mean(dtype=np.float64))
+                avg_conn_time = float(conn_times.mean(dtype=np.float64))
+                max_auth_time = float(auth_times.max())
+                max_conn_time = float(conn_times.max())
+                min_auth_time = float(auth_times.min())
+                min_conn_time = float(conn_times.min())
 
-            except ZeroDivisionError:
+            else:
                 avg_auth_time = 0
                 avg_conn_time = 0
+                max_auth_time = 0
+                max_conn_time = 0
+                min_auth_time = float('inf')
+                min_conn_time = float('inf')
 
             rounds_dict[round_name] = {
                     "avg_auth_time"         : avg_auth_time,
@@ -164,160 +355,261 @@ class SSHstress:
                     }
         stats["round_data"] = (rounds_dict)
 
-        if graph:
-            gen_graph(stats)
+        if graph or graph_out:
+            gen_graph(stats, graph_out)
 
         return stats
 
 
-    async def _sftp(self, count:int, user:str = 'root', conn_wait:int = 0, sftp_ls:str = '/') -> dict:
-        print(f'id: {count} | Openning SFTP connection for user: {user}')
+    async def _run(self, count:int, store, user:str = 'root', conn_wait:int = 0, sftp_ls:Optional[str] = None) -> None:
+        """Run a single connection, listing sftp_ls over SFTP or running a command over SSH when it's None.
+        The results are saved with store, either _store or _store_totals bound to the round's data."""
+        self._log('id: %s | Openning %s connection for user: %s', count, 'SSH' if sftp_ls is None else 'SFTP', user)
         try:
             start_time = time.perf_counter()
-            async with asyncssh.connect(
-                host=self.host, 
-                username=user,
-                client_keys=[self.ssh_key] if self.ssh_key else None, 
-                password=self.ssh_pw,
-                port=self.port,
-                # Authentication timeout
-                login_timeout=0,
-                # Authentication timeout + TCP
-                connect_timeout=0
-            ) as conn:
+            async with asyncssh.connect(host=self.host, username=user, options=self._opts, config=None) as conn:
                 auth_time = time.perf_counter() - start_time
-                async with conn.start_sftp_client() as sftp:
-                    result = await asyncio.wait_for(sftp.listdir(sftp_ls), timeout=self.timeout)
-                    if wait:
-                        while wait:
-                            await asyncio.sleep(0.1)
-                    else:
-                        await asyncio.sleep(conn_wait)
-                    conn.close()
-                    total_time = time.perf_counter() - start_time
-                    conn_stat = {
-                            "id"        : count,
-                            "success"   : True,
-                            "auth_time" : auth_time,
-                            "conn_time" : total_time,
-                            "results"   : result,
-                            }
-                    print(f'id: {conn_stat["id"]} | time: {conn_stat["conn_time"]}')
-
-                    return conn_stat
+                if sftp_ls is not None:
+                    async with conn.start_sftp_client() as sftp:
+                        result = await asyncio.wait_for(sftp.listdir(sftp_ls), timeout=self.timeout)
+                else:
+                    result = (await asyncio.wait_for(conn.run('dir'), timeout=self.timeout)).stdout
+                if self._wait_for_drop:
+                    await self._drop.wait()
+                else:
+                    await asyncio.sleep(conn_wait)
+                conn.close()
+                total_time = time.perf_counter() - start_time
+                store(count, True, auth_time, total_time, result)
+                self._log('id: %s | time: %s', count, total_time)
 
         except (OSError, asyncssh.Error, asyncio.TimeoutError) as e:
-            conn_stat = {
-                    "id"        : count,
-                    "success"   : False,
-                    "auth_time" : None,
-                    "conn_time" : None,
-                    "results"   : str(e),
-                    }
-            print(f'id: {conn_stat["id"]} | failed, err: {conn_stat["results"]}')
+            store(count, False, None, None, str(e))
+            self._log('id: %s | failed, err: %s', count, e)
+
+
+    def _store(self, conn_data:dict, count:int, success:bool, auth_time:Optional[float], conn_time:Optional[float], result) -> None:
+        # Stored at id-1, ids are handed out in order
+        i = count - 1
+        if success:
+            conn_data["success"][i]   = True
+            conn_data["auth_time"][i] = auth_time
+            conn_data["conn_time"][i] = conn_time
+        conn_data["results"][i] = result
+
+
+    def _store_totals(self, totals:dict, count:int, success:bool, auth_time:Optional[float], conn_time:Optional[float], result) -> None:
+        self._out_fp.write(dump_json_line({
+                "round"     : totals["round"],
+                "id"        : count,
+                "success"   : success,
+                "auth_time" : auth_time,
+                "conn_time" : conn_time,
+                "results"   : result,
+                }))
+
+        totals["conns"] += 1
+        if not success:
+            totals["failed"] += 1
+            return
+        totals["sum_auth_time"] += auth_time
+        totals["sum_conn_time"] += conn_time
+        totals["max_auth_time"]  = max(totals["max_auth_time"], auth_time)
+        totals["max_conn_time"]  = max(totals["max_conn_time"], conn_time)
+        totals["min_auth_time"]  = min(totals["min_auth_time"], auth_time)
+        totals["min_conn_time"]  = min(totals["min_conn_time"], conn_time)
 
-            return conn_stat
 
+    def _log(self, msg:str, *args) -> None:
+        # Formatting is deferred to the log worker and skipped entirely when quiet
+        if not self.quiet:
+            self._log_q.put_nowait((msg, args))
 
-    async def _ssh(self, count:int, user:str = 'root', conn_wait:int = 0) -> dict:
-        print(f'id: {count} | Openning SSH connection for user: {user}')
-        try:
-            start_time = time.perf_counter()
-            async with asyncssh.connect(
-                host=self.host,
-                username=user,
-                client_keys=[self.ssh_key] if self.ssh_key else None,
-                password=self.ssh_pw,
-                port=self.port,
-                # Authentication timeout
-                login_timeout=0,
-                # Authentication timeout + TCP
-                connect_timeout=0
-            ) as conn:
-                auth_time = time.perf_counter() - start_time
-                result = await asyncio.wait_for(conn.run('dir'), timeout=self.timeout)
-                if wait:
-                    while wait:
-                        await asyncio.sleep(0.1)
-                else:
-                    await asyncio.sleep(conn_wait)
-                conn.close()
-                total_time = time.perf_counter() - start_time
-                conn_stat = {
-                        "id"        : count,
-                        "success"   : True,
-                        "auth_time" : auth_time,
-                        "conn_time" : total_time,
-                        "results"   : result,
-                        }
-                print(f'id: {conn_stat["id"]} | time: {conn_stat["conn_time"]}')
 
-                return conn_stat
+    async def _log_worker(self) -> None:
+        while True:
+            batch = [await self._log_q.get()]
+            # Give the connections a moment to queue up more lines, so they
+            # are written out with a single call
+            await asyncio.sleep(0.05)
+            while not self._log_q.empty():
+                batch.append(self._log_q.get_nowait())
 
-        except (OSError, asyncssh.Error, asyncio.TimeoutError) as e:
-            conn_stat = {
-                    "id"        : count,
-                    "success"   : False,
-                    "auth_time" : None,
-                    "conn_time" : None,
-                    "results"   : str(e),
-                    }
-            print(f'id: {conn_stat["id"]} | failed, err: {conn_stat["results"]}')
+            sys.stdout.write("".join(f"{msg % args}\n" for msg, args in filter(None, batch)))
+            sys.stdout.flush()
+            if None in batch:
+                return
 
-            return conn_stat
 
+    def _drop_all(self) -> None:
+        if self._announce_drop:
+            print(f'Dropping all connections now')
+        self._drop.set()
 
-    async def _hammer(self, conns:int, conn_wait:int = 0, global_wait:int = 0, conns_per_sec:int = 100, sftp:bool = True, sftp_ls:str = '/') -> dict:
-        loop_speed = 1/conns_per_sec
 
-        # Drop all the connections at the exact second
-        timer_thread = threading.Thread(target=drop_all_timer, args=(global_wait,))
-        timer_thread.start()
+    async def _hammer(self, conns:int, conn_wait:int = 0, global_wait:int = 0, conns_per_sec:float = 100, sftp:bool = True, sftp_ls:str = '/', drop_at:Optional[float] = None, totals:Optional[dict] = None) -> Optional[dict]:
+        loop_speed = 1/conns_per_sec
+        sftp_ls = sftp_ls if sftp else None
+
+        # Drop all the connections at the exact second, the event is set
+        # once it's time to drop them. Created here since run()
+        # starts a new event loop on every round.
+        # When drop_at is given, it's a time.time() timestamp shared by all
+        # the workers, which the parent process already announced.
+        self._drop = asyncio.Event()
+        self._wait_for_drop = global_wait > 0
+        self._announce_drop = drop_at is None
+        if self._wait_for_drop:
+            if drop_at is None:
+                print(f'Dropping all connections in {global_wait} seconds')
+                drop_at = time.time() + global_wait
+            loop = asyncio.get_running_loop()
+            loop.call_at(loop.time() + drop_at - time.time(), self._drop_all)
+
+        self._log_q = asyncio.Queue()
+        log_worker = None if self.quiet else asyncio.create_task(self._log_worker())
+
+        live = set()
+        # With totals the results are streamed to the JSON lines file and
+        # only the running totals are kept, nothing is returned
+        if totals is None:
+            conn_data = new_conn_data(conns)
+            store = partial(self._store, conn_data)
+        else:
+            conn_data = None
+            store = partial(self._store_totals, totals)
+        # Skip picking a user per connection in the common single user case
+        single_user = self.users[0] if len(self.users) == 1 else None
+        # Set whenever a connection finishes, wakes up the spawn loop when
+        # it's throttled on max_concurrent_tasks
+        slot = asyncio.Event()
+
+        def _on_done(task):
+            live.discard(task)
+            slot.set()
+            # The connection is left marked as failed
+            if not task.cancelled() and task.exception() is not None:
+                print(f'ERROR: connection task crashed, err: {task.exception()}')
 
         count = 0
-        tasks = set()
+        # Connections are paced against a deadline rather than sleeping a
+        # fixed amount, so scheduling jitter doesn't add up over the round
+        deadline = time.perf_counter()
+        while count < conns:
+            if len(live) >= self.max_concurrent_tasks:
+                slot.clear()
+                await slot.wait()
+                # Don't burst out the connections missed while throttled
+                deadline = max(deadline, time.perf_counter())
+                continue
+
+            count += 1
+            user = single_user or self.users[(count - 1) % len(self.users)]
+            task = asyncio.create_task(self._run(count, store, user, conn_wait, sftp_ls))
+            live.add(task)
+            task.add_done_callback(_on_done)
+
+            # Delay between each connections initiation, when running behind
+            # only yield to the event loop to catch up
+            deadline += loop_speed
+            await asyncio.sleep(max(0, deadline - time.perf_counter()))
+
+        await asyncio.gather(*live, return_exceptions=True)
+
+        if log_worker:
+            # Flush whatever is left and stop the worker
+            self._log_q.put_nowait(None)
+            await log_worker
+        return conn_data
+
+
+    def _round(self, conns:int, conn_wait:int, global_wait:int, conns_per_sec:float, workers:int, sftp:bool = True, sftp_ls:str = '/', totals:Optional[dict] = None) -> Optional[dict]:
+        if workers <= 1:
+            return run(self._hammer(conns, conn_wait, global_wait, conns_per_sec, sftp=sftp, sftp_ls=sftp_ls, totals=totals))
+
+        # Split the connections, rate and task limit between the workers,
+        # each one runs its own event loop in a separate process
+        shards = [conns // workers + (1 if i < conns % workers else 0) for i in range(workers)]
+        shards = [shard_conns for shard_conns in shards if shard_conns]
+        kwargs = dict(self._kwargs, max_concurrent_tasks=max(1, self.max_concurrent_tasks // len(shards)), output_jsonl=None)
+
+        # The workers start at different times, they all drop their
+        # connections at the same absolute time instead
+        drop_at = None
+        if global_wait > 0:
+            drop_at = time.time() + global_wait
+            print(f'Dropping all connections in {global_wait} seconds, at {time.strftime("%H:%M:%S", time.localtime(drop_at))}')
+
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(_hammer_shard, kwargs, shard_conns, conn_wait, global_wait, conns_per_sec / len(shards), sftp, sftp_ls, drop_at) for shard_conns in shards]
+            # The workers don't announce the drop, do it once from here if
+            # they're still running by then
+            if drop_at is not None:
+                done, _ = wait(futures, timeout=max(0, drop_at - time.time()))
+                if len(done) < len(futures):
+                    print(f'Dropping all connections now')
+            return merge_conn_data([future.result() for future in futures])
+
+
+    def stress_sftp(self, conns:int, conn_wait:int, global_wait:int, path:str, conns_per_sec:float, rounds:int, graph:bool = False, workers:int = 1, graph_out:Optional[str] = None) -> dict:
+        if self.output_jsonl and workers > 1:
+            raise ValueError("output_jsonl can't be used with multiple workers")
+
         perf_times = {}
-        while count < conns or tasks:
-            if tasks:
-                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                for task in done:
-                    results = task.result()
-                    perf_times[results['id']] = results
-
-            while count < conns and len(tasks) < self.max_concurrent_tasks:
-                count += 1
-                if sftp:
-                    tasks.add(asyncio.create_task(self._sftp(count, next(self.user), conn_wait, sftp_ls=sftp_ls)))
+        round_totals = {}
+        # Connection results are written to the file as they finish
+        self._out_fp = open(self.output_jsonl, 'wb') if self.output_jsonl else None
+        try:
+            for stress_round in range(rounds):
+                stress_round += 1
+                round_name = f"round_{stress_round}"
+                print(f"Round {stress_round} started!")
+                totals = new_conn_totals(round_name) if self._out_fp else None
+                times = self._round(conns, conn_wait, global_wait, conns_per_sec, workers, sftp=True, sftp_ls=path, totals=totals)
+                if totals is None:
+                    perf_times[round_name] = times
                 else:
-                    tasks.add(asyncio.create_task(self._ssh(count, next(self.user), conn_wait)))
+                    round_totals[round_name] = totals
+        finally:
+            if self._out_fp:
+                self._out_fp.close()
+                self._out_fp = None
 
-                # Delay between each connections initiation
-                await asyncio.sleep(loop_speed)
-        return perf_times
+        return self._calculate_stats(perf_times, conns, rounds, conns_per_sec, conn_wait, global_wait, graph, "SFTP", graph_out, round_totals)
 
 
-    def stress_sftp(self, conns:int, conn_wait:int, global_wait:int, path:str, conns_per_sec:int, rounds:int, graph:bool = False) -> dict:
-        perf_times = {}
-        for stress_round in range(rounds):
-            stress_round += 1
-            print(f"Round {stress_round} started!")
-            times = asyncio.run(self._hammer(conns, conn_wait, global_wait, conns_per_sec, sftp=True, sftp_ls=path))
-            times = {k: times[k] for k in sorted(times)}
-            perf_times[f"round_{stress_round}"] = times
+    def stress_ssh(self, conns:int, conn_wait:int, global_wait:int, conns_per_sec:float, rounds:int, graph:bool = False, workers:int = 1, graph_out:Optional[str] = None) -> dict:
+        if self.output_jsonl and workers > 1:
+            raise ValueError("output_jsonl can't be used with multiple workers")
 
-        return self._calculate_stats(perf_times, conns, rounds, conns_per_sec, conn_wait, global_wait, graph, "SFTP")
+        perf_times = {}
+        round_totals = {}
+        # Connection results are written to the file as they finish
+        self._out_fp = open(self.output_jsonl, 'wb') if self.output_jsonl else None
+        try:
+            for stress_round in range(rounds):
+                stress_round += 1
+                round_name = f"round_{stress_round}"
+                print(f"Round {stress_round} started!")
+                totals = new_conn_totals(round_name) if self._out_fp else None
+                times = self._round(conns, conn_wait, global_wait, conns_per_sec, workers, sftp=False, totals=totals)
+                if totals is None:
+                    perf_times[round_name] = times
+                else:
+                    round_totals[round_name] = totals
+        finally:
+            if self._out_fp:
+                self._out_fp.close()
+                self._out_fp = None
 
+        return self._calculate_stats(perf_times, conns, rounds, conns_per_sec, conn_wait, global_wait, graph, "SSH", graph_out, round_totals)
 
-    def stress_ssh(self, conns:int, conn_wait:int, global_wait:int, conns_per_sec:int, rounds:int, graph:bool = False) -> dict:
-        perf_times = {}
-        for stress_round in range(rounds):
-            stress_round += 1
-            print(f"Round {stress_round} started!")
-            times = asyncio.run(self._hammer(conns, conn_wait, global_wait, conns_per_sec, sftp=False))
-            times = {k: times[k] for k in sorted(times)}
-            perf_times[f"round_{stress_round}"] = times
 
-        return self._calculate_stats(perf_times, conns, rounds, conns_per_sec, conn_wait, global_wait, graph, "SSH")
+def _hammer_shard(kwargs:dict, conns:int, conn_wait:int, global_wait:int, conns_per_sec:float, sftp:bool, sftp_ls:str, drop_at:Optional[float]) -> dict:
+    """Run a worker's share of a round, the SSHstress instance is rebuilt so nothing is shared with the parent"""
+    ssh_stress = SSHstress(**kwargs)
+    # run() picks uvloop here as well, spawned workers don't run the __main__ block
+    return run(ssh_stress._hammer(conns, conn_wait, global_wait, conns_per_sec, sftp=sftp, sftp_ls=sftp_ls, drop_at=drop_at))
 
 
 if __name__ == "__main__":
@@ -340,15 +632,19 @@ if __name__ == "__main__":
     parser.add_argument("--type", type=str, default="sftp", help="The type of stress test either SFTP or SSH. (default SFTP)")
     parser.add_argument("--path", type=str, default="/", help="The SFTP Path to check when performing load testing")
     parser.add_argument("-o", "--output", type=str, default="", help="Write the results to a file.")
+    parser.add_argument("--output-jsonl", type=str, default="", help="Write every connection's results to a JSON lines file as they finish instead of keeping them in memory, the graph can't be generated in this mode.")
     parser.add_argument("--read", type=str, default="", help="Read results from a file adn visualize them in a graph.")
     parser.add_argument("--graph", action="store_true", help="Visualize the performance data in a graph.")
+    parser.add_argument("--graph-out", type=str, default="", help="Save the graph to an image file instead of showing it, this works without a display.")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Split the connections between this many processes, useful when a single CPU core can't keep up with the speed. (default 1)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't log every connection, only print the results.")
     args = parser.parse_args()
 
     if args.read:
         file = args.read
-        with open(file, "r") as file:
-            json_data = json.load(file)
-        gen_graph(json_data)
+        with open(file, "rb") as file:
+            json_data = load_json(file.read())
+        gen_graph(json_data, args.graph_out)
         sys.exit(0)
 
     if not args.users:
@@ -359,10 +655,18 @@ if __name__ == "__main__":
         print("Missing argument: target host")
         sys.exit(2)
 
+    if args.output_jsonl and args.workers > 1:
+        print("ERROR: --output-jsonl can't be used with multiple workers")
+        sys.exit(2)
+
+    if args.output_jsonl and (args.graph or args.graph_out):
+        print("ERROR: --output-jsonl can't be used with --graph or --graph-out, the connection data isn't kept in memory")
+        sys.exit(2)
+
 
     print(f"Settings: stress_type: {args.type.lower()} | connections: {args.connections} | global_wait: {args.global_wait} | connection_wait: {args.connection_wait} | speed: {args.speed}/cps")
 
-    ssh_stress_util = SSHstress(target_address=args.target, target_port=args.port, target_users=args.users, ssh_key=args.key, ssh_pw=args.password)
+    ssh_stress_util = SSHstress(target_address=args.target, target_port=args.port, target_users=args.users, ssh_key=args.key, ssh_pw=args.password, quiet=args.quiet, output_jsonl=args.output_jsonl or None)
     match args.type.lower():
         case "sftp":
             stats = ssh_stress_util.stress_sftp(conns=args.connections,
@@ -371,16 +675,18 @@ if __name__ == "__main__":
                                                 conns_per_sec=args.speed,
                                                 rounds=args.rounds,
                                                 path=args.path,
-                                                graph=args.graph)
+                                                graph=args.graph,
+                                                graph_out=args.graph_out,
+                                                workers=args.workers)
             if args.output:
-                with open(args.output, 'w') as file:
-                    json.dump(stats, file, indent=2)
+                with open(args.output, 'wb') as file:
+                    file.write(dump_json(stats))
 
             data = {}
             for round_name, round_stat in stats["round_data"].items():
                 round_stat.pop("conn_data", None)
                 data[round_name] = round_stat
-            print(json.dumps(data, indent=2))
+            print(dump_json(data).decode())
 
         case "ssh":
             stats = ssh_stress_util.stress_ssh(conns=args.connections, 
@@ -388,8 +694,10 @@ if __name__ == "__main__":
                                                global_wait=args.global_wait, 
                                                conns_per_sec=args.speed,
                                                rounds=args.rounds,
-                                               graph=args.graph)
-            print(json.dumps(stats, indent=2))
+                                               graph=args.graph,
+                                               graph_out=args.graph_out,
+                                               workers=args.workers)
+            print(dump_json(stats).decode())
 
         case _:
             print(f"ERROR: Unknown stress test type: {args.type.lower()}")